@@ -1,18 +1,38 @@
-from flask import Flask, request, render_template_string, redirect, url_for, session, jsonify
-import pandas as pd
-from difflib import get_close_matches
+from flask import Flask, request, render_template, redirect, url_for, session, jsonify
+import click
+from jinja2 import DictLoader
+from openpyxl import load_workbook
+from rapidfuzz import process, fuzz, utils
+import csv
+import functools
 import json
 import os
+import pickle
+import re
+import sqlite3
+import string
+import sys
+import threading
 
 app = Flask(__name__)
 
 # Load secret key from environment variable (with fallback for dev)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "fallback_dev_secret_key")
 
+# Let browsers cache the stylesheets under static/ for a year
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 31536000
+
 # Dataset path
 DATASET_PATH = "DATASET_CLEANED.xlsx"
 
-# JSON file for persisting unread messages count
+# Pickled qa_dict sidecar, skips the xlsx parse on warm start
+QA_CACHE_FILE = "qa_dict.pkl"
+
+# SQLite (WAL) store shared by all workers: teacher answers and unread counts
+STATE_DB = "state.db"
+
+# Older file-based stores, imported into STATE_DB on first start
+QA_STORE_FILE = "qa_store.csv"
 UNREAD_FILE = "unread_messages.json"
 
 # Labels & domain mapping
@@ -26,25 +46,167 @@ labels = {
 
 sheets = ["Sheet1", "Sheet2", "Sheet3"]
 
-# Load QA data from all sheets into qa_dict
+def iter_dataset_rows():
+    wb = load_workbook(DATASET_PATH, read_only=True, data_only=True)
+    try:
+        for name in sheets:
+            yield from wb[name].iter_rows(min_row=1, max_col=2, values_only=True)
+    finally:
+        wb.close()
+
+def load_qa_dict():
+    # Reuse the pickled copy if it is newer than the dataset; a bad pickle is just a miss
+    try:
+        if os.path.getmtime(QA_CACHE_FILE) >= os.path.getmtime(DATASET_PATH):
+            with open(QA_CACHE_FILE, "rb") as f:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    qa = {}
+    for row in iter_dataset_rows():
+        q, a = (tuple(row) + (None, None))[:2]
+        if q is None or a is None:
+            continue
+        q, a = str(q), str(a)
+        if q.strip():
+            qa[q] = a
+
+    # Write beside the cache and swap it in so other workers never see a partial file
+    tmp = f"{QA_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(qa, f)
+    os.replace(tmp, QA_CACHE_FILE)
+    return qa
+
+def init_state_db():
+    db = get_db()
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS qa (q TEXT PRIMARY KEY, a TEXT NOT NULL, synced INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS unread (teacher TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('qa_version', 0);
+    """)
+    db.executemany("INSERT OR IGNORE INTO unread (teacher, n) VALUES (?, 0)", [(t,) for t in labels.values()])
+
+    # One-time import of the old file-based stores; another worker may already
+    # have imported and removed a file, so a missing one is skipped
+    try:
+        with open(QA_STORE_FILE, "r", newline="", encoding="utf-8") as f:
+            rows = [row[:2] for row in csv.reader(f) if len(row) >= 2 and row[0].strip()]
+    except FileNotFoundError:
+        pass
+    else:
+        if rows:
+            db.executemany("INSERT OR REPLACE INTO qa (q, a) VALUES (?, ?)", rows)
+            db.execute("UPDATE meta SET value = value + 1 WHERE key = 'qa_version'")
+        _remove_legacy_file(QA_STORE_FILE)
+    try:
+        with open(UNREAD_FILE, "r") as f:
+            counts = json.load(f)
+    except FileNotFoundError:
+        pass
+    else:
+        db.executemany(
+            "INSERT INTO unread (teacher, n) VALUES (?, ?) ON CONFLICT(teacher) DO UPDATE SET n = excluded.n",
+            counts.items()
+        )
+        _remove_legacy_file(UNREAD_FILE)
+
+def _remove_legacy_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+_db_local = threading.local()
+
+def get_db():
+    # One connection per thread; WAL lets workers read while another writes
+    db = getattr(_db_local, "db", None)
+    if db is None:
+        db = sqlite3.connect(STATE_DB, isolation_level=None, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        _db_local.db = db
+    return db
+
+def add_answer(question, answer):
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("INSERT OR REPLACE INTO qa (q, a) VALUES (?, ?)", (question, answer))
+        db.execute("UPDATE meta SET value = value + 1 WHERE key = 'qa_version'")
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+
+def get_unread_messages():
+    return dict(get_db().execute("SELECT teacher, n FROM unread ORDER BY rowid"))
+
+def increment_unread(teacher):
+    get_db().execute(
+        "INSERT INTO unread (teacher, n) VALUES (?, 1) ON CONFLICT(teacher) DO UPDATE SET n = n + 1",
+        (teacher,)
+    )
+
+def reset_unread(teacher):
+    get_db().execute(
+        "INSERT INTO unread (teacher, n) VALUES (?, 0) ON CONFLICT(teacher) DO UPDATE SET n = 0",
+        (teacher,)
+    )
+
+def sync_qa_store_to_dataset():
+    # Fold unsynced teacher answers into Sheet1 with one workbook open/save
+    db = get_db()
+    rows = db.execute("SELECT q, a FROM qa WHERE synced = 0").fetchall()
+    if rows:
+        wb = load_workbook(DATASET_PATH)
+        ws = wb["Sheet1"]
+        for row in rows:
+            ws.append(list(row))
+        # Save beside the dataset and swap it in so booting workers never read a partial zip
+        tmp = f"{DATASET_PATH}.{os.getpid()}.tmp"
+        wb.save(tmp)
+        os.replace(tmp, DATASET_PATH)
+        db.executemany("UPDATE qa SET synced = 1 WHERE q = ? AND a = ?", rows)
+    return len(rows)
+
+@app.cli.command("sync-dataset")
+def sync_dataset_command():
+    """Append answers from the QA store to the dataset xlsx."""
+    click.echo(f"Synced {sync_qa_store_to_dataset()} answers to {DATASET_PATH}")
+
+init_state_db()
+
+# Load QA data from all sheets; teacher answers from the state db are merged on top
+dataset_qa = load_qa_dict()
 qa_dict = {}
-for sheet in sheets:
-    df = pd.read_excel(DATASET_PATH, sheet_name=sheet, usecols=[0, 1], header=None, dtype=str)
-    df.dropna(inplace=True)
-    df = df[df[0].str.strip() != ""]
-    df.columns = ["Question", "Answer"]
-    qa_dict.update(dict(zip(df["Question"], df["Answer"])))
-
-# Load unread messages from JSON or initialize
-if os.path.exists(UNREAD_FILE):
-    with open(UNREAD_FILE, "r") as f:
-        unread_messages = json.load(f)
-else:
-    unread_messages = {teacher: 0 for teacher in labels.values()}
-
-def save_unread_messages():
-    with open(UNREAD_FILE, "w") as f:
-        json.dump(unread_messages, f)
+
+# qa_version plus normalized keys and parallel answers for fuzzy matching,
+# swapped in as one tuple
+QA_INDEX = (None, [], [])
+
+def build_qa_index(version):
+    global QA_INDEX
+    items = [(sys.intern(utils.default_process(k)), v) for k, v in qa_dict.items()]
+    QA_INDEX = (version, [k for k, _ in items], [v for _, v in items])
+
+_qa_lock = threading.Lock()
+
+def refresh_qa():
+    # Rebuild the match index when any worker has added an answer
+    global qa_dict
+    version = get_db().execute("SELECT value FROM meta WHERE key = 'qa_version'").fetchone()[0]
+    if version == QA_INDEX[0]:
+        return
+    with _qa_lock:
+        if version == QA_INDEX[0]:
+            return
+        merged = dict(dataset_qa)
+        merged.update(get_db().execute("SELECT q, a FROM qa"))
+        qa_dict = merged
+        build_qa_index(version)
 
 common_responses = {
     "hi": "Hello! How can I assist you today?",
@@ -62,6 +224,12 @@ common_responses = {
     "what's up": "Not much, just here to help you! What can I do for you?"
 }
 
+# Greeting lookups ignore punctuation so "hi!" and "what's up?" hit the table;
+# the question itself is passed on unaltered
+_NORMALIZE = str.maketrans("", "", string.punctuation)
+
+COMMON = {k.translate(_NORMALIZE).strip(): v for k, v in common_responses.items()}
+
 domain_keywords = {
     "Admission": ["admission", "admit", "apply", "form", "test", "document", "verification", "eligibility", "deadline"],
     "Scholarship": ["scholarship", "financial aid", "grant", "funding", "tuition", "discount", "fee waiver"],
@@ -71,23 +239,45 @@ domain_keywords = {
 }
 
 def get_answer_from_dataset(question):
-    matches = get_close_matches(question, qa_dict.keys(), n=1, cutoff=0.6)
-    if matches:
-        return qa_dict[matches[0]]
+    # Keyed on the index version so a lookup racing a rebuild can't leave a
+    # stale answer behind for the new index
+    return _lookup_answer(question, QA_INDEX[0])
+
+@functools.lru_cache(maxsize=4096)
+def _lookup_answer(question, version):
+    _, keys, answers = QA_INDEX
+    match = process.extractOne(
+        utils.default_process(question),
+        keys,
+        scorer=fuzz.ratio,
+        score_cutoff=60
+    )
+    if match:
+        return answers[match[2]]
     return None
 
+DOMAIN_LIST = list(domain_keywords)
+DOMAIN_IDX = {domain: i for i, domain in enumerate(DOMAIN_LIST)}
+KEYWORD_TO_IDX = [(kw, DOMAIN_IDX[domain]) for domain, kws in domain_keywords.items() for kw in kws]
+
+# Keyword scanner: one C-level pass, lookahead so overlapping keywords are all seen
+KW2IDX = dict(KEYWORD_TO_IDX)
+KW_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(KW2IDX, key=len, reverse=True)) + "))"
+)
+
 def classify_query(query):
     query = query.lower()
-    domain_match_counts = {domain: 0 for domain in domain_keywords.keys()}
+    counts = [0] * len(DOMAIN_LIST)
     
-    for domain, keywords in domain_keywords.items():
-        for keyword in keywords:
-            if keyword in query:
-                domain_match_counts[domain] += 1
+    # Each keyword counts once, however often it appears
+    for keyword in {m.group(1) for m in KW_RE.finditer(query)}:
+        counts[KW2IDX[keyword]] += 1
     
-    max_matches = max(domain_match_counts.values())
-    if max_matches > 0:
-        best_domain = [domain for domain, count in domain_match_counts.items() if count == max_matches][0]
+    # First domain wins ties, as before
+    best = max(range(len(counts)), key=counts.__getitem__)
+    if counts[best] > 0:
+        best_domain = DOMAIN_LIST[best]
         teacher = labels[best_domain]
         return best_domain, teacher
     
@@ -95,87 +285,38 @@ def classify_query(query):
     teacher = labels["Student Affairs"]
     return "Student Affairs", teacher
 
+refresh_qa()
+
 @app.route("/", methods=["GET", "POST"])
 def home():
-    chatbot_response = session.get("bot_response", "")
+    # A teacher's answer is handed over once through the session, then dropped
+    chatbot_response = session.pop("bot_response", "")
     if request.method == "POST":
         question = request.form.get("student_query", "").strip().lower()
-        
-        if question in common_responses:
-            chatbot_response = common_responses[question]
+        if not question:
+            return render_template("chatbot.html", chatbot_response=chatbot_response)
+
+        common = COMMON.get(question.translate(_NORMALIZE).strip())
+        if common is not None:
+            chatbot_response = common
         else:
+            refresh_qa()
             answer = get_answer_from_dataset(question)
             if answer:
                 chatbot_response = answer
             else:
                 domain, teacher = classify_query(question)
-                session['unanswered_question'] = question
-                session['assigned_teacher'] = teacher
-                # Increment unread count & save
-                unread_messages[teacher] = unread_messages.get(teacher, 0) + 1
-                save_unread_messages()
+                session.update(unanswered_question=question, assigned_teacher=teacher)
+                increment_unread(teacher)
                 return redirect(url_for("teacher_input"))
-        session["bot_response"] = chatbot_response
-    return render_template_string(chatbot_template, chatbot_response=chatbot_response)
+    return render_template("chatbot.html", chatbot_response=chatbot_response)
 
 chatbot_template = """
 <!DOCTYPE html>
 <html>
 <head>
     <title>AUST Guidance Chatbot</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            background-color: #f4f4f9;
-            margin: 0;
-            padding: 0;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-        }
-        .chat-container {
-            background: white;
-            border-radius: 10px;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-            width: 400px;
-            padding: 20px;
-        }
-        h2 {
-            text-align: center;
-            color: #333;
-        }
-        form {
-            display: flex;
-            flex-direction: column;
-        }
-        input[type="text"] {
-            padding: 10px;
-            margin-bottom: 10px;
-            border: 1px solid #ccc;
-            border-radius: 5px;
-            font-size: 16px;
-        }
-        button {
-            padding: 10px;
-            background-color: #007bff;
-            color: white;
-            border: none;
-            border-radius: 5px;
-            cursor: pointer;
-            font-size: 16px;
-        }
-        button:hover {
-            background-color: #0056b3;
-        }
-        .response {
-            margin-top: 20px;
-            padding: 10px;
-            background-color: #e9ecef;
-            border-radius: 5px;
-            color: #333;
-        }
-    </style>
+    <link rel="stylesheet" href="{{ url_for('static', filename='chatbot.css') }}">
 </head>
 <body>
     <div class="chat-container">
@@ -197,71 +338,7 @@ teacher_template = """
 <html>
 <head>
     <title>Teacher Assistant</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            background-color: #f4f4f9;
-            margin: 0;
-            padding: 0;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-        }
-        .teacher-container {
-            background: white;
-            border-radius: 10px;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-            width: 500px;
-            padding: 20px;
-        }
-        h3 {
-            text-align: center;
-            color: #333;
-        }
-        .teacher-list {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 10px;
-            justify-content: center;
-            margin-bottom: 20px;
-        }
-        .teacher-list button {
-            padding: 10px 20px;
-            background-color: #28a745;
-            color: white;
-            border: none;
-            border-radius: 5px;
-            cursor: pointer;
-            font-size: 14px;
-        }
-        .teacher-list button:hover {
-            background-color: #218838;
-        }
-        .unread {
-            background: red;
-            color: white;
-            padding: 3px 7px;
-            border-radius: 50%;
-            font-size: 12px;
-            margin-left: 5px;
-        }
-        textarea {
-            width: 100%;
-            padding: 10px;
-            border: 1px solid #ccc;
-            border-radius: 5px;
-            font-size: 16px;
-            margin-bottom: 10px;
-        }
-        .response {
-            margin-top: 20px;
-            padding: 10px;
-            background-color: #e9ecef;
-            border-radius: 5px;
-            color: #333;
-        }
-    </style>
+    <link rel="stylesheet" href="{{ url_for('static', filename='teacher.css') }}">
 </head>
 <body>
     <div class="teacher-container">
@@ -286,12 +363,6 @@ teacher_template = """
         {% else %}
             <p>Select a teacher above to see unanswered questions.</p>
         {% endif %}
-        
-        {% if bot_response %}
-            <div class="response">
-                <strong>Bot will say:</strong> <p>{{ bot_response }}</p>
-            </div>
-        {% endif %}
     </div>
 <script>
 function selectTeacher(teacher) {
@@ -302,29 +373,24 @@ function selectTeacher(teacher) {
 </html>
 """
 
+# Serve the inline templates through the app loader so Jinja compiles them once
+app.jinja_loader = DictLoader({
+    "chatbot.html": chatbot_template,
+    "teacher.html": teacher_template
+})
+
 @app.route("/teacher", methods=["GET", "POST"])
 def teacher_input():
     assigned_teacher = session.get("assigned_teacher")
     question = session.get("unanswered_question")
-    bot_response = session.get("bot_response", "")
 
     if request.method == "POST":
         response = request.form.get("teacher_response", "").strip()
         if response and assigned_teacher and question:
-            # Load existing sheet data
-            df_existing = pd.read_excel(DATASET_PATH, sheet_name="Sheet1", header=None, dtype=str)
-            df_existing.columns = ["Question", "Answer"]
-            # Append new entry
-            new_entry = pd.DataFrame({"Question": [question], "Answer": [response]})
-            new_df = pd.concat([df_existing, new_entry], ignore_index=True)
-            # Write full data back
-            with pd.ExcelWriter(DATASET_PATH, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                new_df.to_excel(writer, sheet_name="Sheet1", index=False, header=False)
-            # Update in-memory dictionary
-            qa_dict[question] = response
-            # Reset unread count & save
-            unread_messages[assigned_teacher] = 0
-            save_unread_messages()
+            # Store the answer where every worker will pick it up
+            add_answer(question, response)
+            refresh_qa()
+            reset_unread(assigned_teacher)
             # Clear session and redirect to home
             session.pop('unanswered_question', None)
             session.pop('assigned_teacher', None)
@@ -333,8 +399,9 @@ def teacher_input():
 
     # For GET request, optionally get teacher param from URL to show question assigned to that teacher
     selected_teacher = request.args.get("teacher")
+    unread = get_unread_messages()
     # Show assigned question only if teacher matches
-    if selected_teacher and unread_messages.get(selected_teacher, 0) > 0:
+    if selected_teacher and unread.get(selected_teacher, 0) > 0:
         # Find unanswered question assigned to that teacher in session or elsewhere
         # For simplicity, showing session question only if matches
         if selected_teacher == assigned_teacher and question:
@@ -347,14 +414,14 @@ def teacher_input():
         assigned_teacher = None
         question = None
 
-    return render_template_string(
-        teacher_template,
-        unread=unread_messages,
+    return render_template(
+        "teacher.html",
+        unread=unread,
         assigned_teacher=assigned_teacher,
-        question=question,
-        bot_response=bot_response
+        question=question
     )
 
+# Production runs under gunicorn (see Procfile); this is the dev server only
 if __name__ == "__main__":
     import os
     port = int(os.environ.get("PORT", 5000))